@@ -13,32 +13,61 @@ Input format:
   ]
 }
 
+Columnar alternative (parsed in a single numpy call, faster for large batches):
+{
+  "columns": ["alcohol", "malic_acid", ...],  # ALL features, any order
+  "data": [[13.2, 1.78, ...], [...]]          # one row per instance, values in "columns" order
+}
+
 Notes:
 - Basic validation: verifies that required keys are present and builds X in the trained order.
 - Returns sklearn class ids and class names.
+- `?precision=q8` returns probabilities quantized to uint8 (base64, 8x smaller than float64
+  JSON numbers) instead of a float list; decode with
+  np.frombuffer(base64.b64decode(probas_q8), np.uint8).reshape(shape) * scale.
+- Probabilities are cached per input row (LRU), so repeated instances skip the model.
+- Optional dynamic batching (ENABLE_BATCHING=1): concurrent requests handled by the same
+  process are coalesced into a single model call of up to MAX_BATCH rows, waiting at most
+  MAX_WAIT_MS for the batch to fill. Only useful with threaded workers.
+- Inference runs on the first available backend: the Treelite-compiled forest
+  (model_tl.so), then the ONNX export (model.onnx, onnxruntime), then the joblib model.
 
-Local execution:
-    python app.py
+Execution:
+    gunicorn -c gunicorn.conf.py app:app   # production (see gunicorn.conf.py)
+    python app.py                          # local debug only (Flask dev server)
 """
 
 # =========================
 # Imports
 # =========================
-import json
+import base64
+import logging
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass, field
 from pathlib import Path
 from typing import List, Dict, Any
 import joblib
 import numpy as np
-from flask import Flask, jsonify, request
-from sklearn.pipeline import Pipeline
-from sklearn.datasets import load_wine
+import onnxruntime as ort
+import orjson
+import tl2cgen
+from flask import Flask, request
+from sklearn.ensemble import RandomForestClassifier
 
 # =========================
 # Load artifacts at startup (once)
 # =========================
 ARTIFACTS_DIR = Path(".")
 MODEL_PATH = ARTIFACTS_DIR / "model.joblib"
+ONNX_PATH = ARTIFACTS_DIR / "model.onnx"
+TREELITE_PATH = ARTIFACTS_DIR / "model_tl.so"
 FEATURES_PATH = ARTIFACTS_DIR / "features.json"
+META_PATH = ARTIFACTS_DIR / "model_meta.json"
 
 if not MODEL_PATH.exists() or not FEATURES_PATH.exists():
     raise FileNotFoundError(
@@ -46,18 +75,152 @@ if not MODEL_PATH.exists() or not FEATURES_PATH.exists():
         "Run first: python train_model.py"
     )
 
-MODEL: Pipeline = joblib.load(MODEL_PATH)
-with open(FEATURES_PATH, "r", encoding="utf-8") as f:
-    FEATURE_ORDER = json.load(f)["feature_order"]
+# mmap_mode: only estimator-level arrays (e.g. classes_) are backed by a read-only map
+# of the file. Tree.__setstate__ copies the tree nodes (thresholds, values) into its own
+# buffer, so those are shared across workers only through preload_app copy-on-write.
+MODEL: RandomForestClassifier = joblib.load(MODEL_PATH, mmap_mode="r")
+# Single-threaded predict: each server worker is one process, joblib threads would compete
+MODEL.n_jobs = 1
+
+# Hyperparameters chosen at training time (optional artifact), logged once at startup
+MODEL_META = {}
+if META_PATH.exists():
+    MODEL_META = orjson.loads(META_PATH.read_bytes())
 
-# To map class id to readable name, reuse sklearn's dataset
-WINE = load_wine()
-CLASS_NAMES = list(WINE.target_names)
+# Compiled backend for the hot path: Treelite library if present, else ONNX session.
+# One thread each: parallelism comes from the server's worker processes, not from
+# inside each call. The joblib model stays loaded as fallback and for classes_.
+PREDICTOR = None
+SESSION = None
+if TREELITE_PATH.exists():
+    PREDICTOR = tl2cgen.Predictor(str(TREELITE_PATH), nthread=1)
+elif ONNX_PATH.exists():
+    so = ort.SessionOptions()
+    so.intra_op_num_threads = 1
+    SESSION = ort.InferenceSession(
+        str(ONNX_PATH), sess_options=so, providers=["CPUExecutionProvider"]
+    )
+# Feature order and class names (class id -> readable name), saved at training time
+FEATURES = orjson.loads(FEATURES_PATH.read_bytes())
+FEATURE_ORDER = FEATURES["feature_order"]
+FEATURE_ORDER_T = tuple(FEATURE_ORDER)
+N_FEAT = len(FEATURE_ORDER_T)
+CLASS_NAMES = FEATURES["class_names"]
+CLASS_NAMES_ARR = np.asarray(CLASS_NAMES)
+
+# =========================
+# Prediction cache: input row bytes (float32) -> class probabilities
+# =========================
+PROBA_CACHE_SIZE = 4096
+_PROBA_CACHE = OrderedDict()
+_PROBA_CACHE_LOCK = threading.Lock()
+
+# =========================
+# Dynamic batching across concurrent requests (off by default)
+# =========================
+ENABLE_BATCHING = os.environ.get("ENABLE_BATCHING", "0") == "1"
+MAX_BATCH = int(os.environ.get("MAX_BATCH", "64"))
+MAX_WAIT_MS = float(os.environ.get("MAX_WAIT_MS", "5"))
+
+
+@dataclass
+class _InferenceRequest:
+    """Rows waiting for the batching thread, plus the future their probabilities are set on."""
+    data: np.ndarray
+    future: Future = field(default_factory=Future)
+
+    @property
+    def size(self):
+        return self.data.shape[0]
+
+
+_BATCH_QUEUE = queue.Queue()
+_BATCHER_PID = None
+_BATCHER_LOCK = threading.Lock()
+
+# Per-thread (MAX_BATCH, N_FEAT) input buffer reused across requests (see _row_buffer)
+_BUFFERS = threading.local()
 
 # =========================
 # Flask initialization
 # =========================
 app = Flask(__name__)
+app.logger.setLevel(logging.INFO)
+if MODEL_META:
+    app.logger.info("Loaded model with hyperparameters: %s", MODEL_META)
+
+
+def _json_response(obj):
+    """
+    Serialize `obj` with orjson (numpy arrays supported) into a JSON response.
+    Faster drop-in for flask.jsonify.
+    """
+    return app.response_class(
+        orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY), mimetype="application/json"
+    )
+
+
+def _quantize_probas(probas):
+    """
+    Quantize probabilities to 256 levels over [0, 1] for a compact response.
+
+    Args:
+        probas (np.ndarray): Class probabilities with shape (n_instances, n_classes).
+
+    Returns:
+        dict: "probas_q8" (base64 of the row-major uint8 bytes), "shape" and "scale"
+            (multiply the decoded uint8 values by it to get probabilities back).
+    """
+    q = np.clip(np.rint(probas * 255), 0, 255).astype(np.uint8)
+    return {
+        "probas_q8": base64.b64encode(q.tobytes()).decode("ascii"),
+        "shape": list(q.shape),
+        "scale": 1 / 255,
+    }
+
+
+def _first_non_numeric(row):
+    """Return the first expected feature of `row` whose value cannot be converted to float."""
+    for f in FEATURE_ORDER_T:
+        try:
+            float(row[f])
+        except Exception:
+            return f
+    return None
+
+
+def _first_non_finite(X):
+    """
+    Locate the first NaN / infinite value of a feature matrix in FEATURE order.
+
+    The compiled backends (Treelite, ONNX) do not run sklearn's input checks and disagree
+    with sklearn on such values, so they are rejected before prediction. Infinity also
+    comes from values too large for float32 (e.g. 1e300), which overflow in the cast.
+
+    Returns:
+        (row, feature) (tuple[int, str] | None): Position of the first non-finite value,
+            or None if every value is finite.
+    """
+    finite = np.isfinite(X)
+    if finite.all():
+        return None
+    row, col = np.argwhere(~finite)[0]
+    return int(row), FEATURE_ORDER_T[col]
+
+
+def _row_buffer(n):
+    """
+    Return an (n, N_FEAT) float32 array to build a request's feature matrix in.
+
+    Requests of up to MAX_BATCH rows get a view on a buffer preallocated once per thread,
+    so the hot path does not allocate. Larger requests get a fresh array.
+    """
+    if n > MAX_BATCH:
+        return np.empty((n, N_FEAT), dtype=np.float32)
+    buf = getattr(_BUFFERS, "X", None)
+    if buf is None:
+        buf = _BUFFERS.X = np.empty((MAX_BATCH, N_FEAT), dtype=np.float32)
+    return buf[:n]
 
 
 def _validate_and_build_matrix(instances):
@@ -68,36 +231,268 @@ def _validate_and_build_matrix(instances):
         instances (List[Dict[str, Any]]): List of instances where each dict maps feature->value. Values can be int or float.
 
     Returns:
-        X (np.ndarray): Feature matrix with shape (n_instances, n_features).
+        X (np.ndarray): float32 feature matrix with shape (n_instances, n_features).
+            Read-only view on the thread's reusable buffer (see _row_buffer): only valid
+            until the same thread builds the next matrix, i.e. for the current request.
 
     Side effects:
-        Raises ValueError with a clear message if keys are missing/extra or types are invalid.
+        Raises ValueError with a clear message if keys are missing/extra, types are invalid
+        or values are not finite.
     """
     if not isinstance(instances, list) or len(instances) == 0:
         raise ValueError("The 'instances' field must be a non-empty list.")
 
-    X_rows = []
-    for idx, row in enumerate(instances):
-        if not isinstance(row, dict):
-            raise ValueError(f"Instance at position {idx} is not a valid JSON object.")
-        # Check required keys are present
-        missing = [f for f in FEATURE_ORDER if f not in row]
-        if missing:
-            raise ValueError(f"Missing features in instance {idx}: {missing}")
-
-        # Take only expected features in the correct order
-        values = []
-        for f in FEATURE_ORDER:
-            v = row[f]
-            # Robust conversion to float
+    X = _row_buffer(len(instances))
+    # Overflow to inf in the float32 cast is reported below, not as a numpy warning
+    with np.errstate(over="ignore"):
+        for idx, row in enumerate(instances):
+            if not isinstance(row, dict):
+                raise ValueError(f"Instance at position {idx} is not a valid JSON object.")
+            # Take only expected features in the correct order; numpy does the float
+            # conversion of the whole row in one C-level assignment.
             try:
-                v = float(v)
-            except Exception:
-                raise ValueError(f"Value of '{f}' in instance {idx} is not numeric.")
-            values.append(v)
-        X_rows.append(values)
+                values = [row[f] for f in FEATURE_ORDER_T]
+                if None in values:
+                    # numpy would silently turn None into NaN
+                    raise TypeError
+                X[idx] = values
+            except KeyError:
+                missing = [f for f in FEATURE_ORDER_T if f not in row]
+                raise ValueError(f"Missing features in instance {idx}: {missing}")
+            except (TypeError, ValueError):
+                raise ValueError(
+                    f"Value of '{_first_non_numeric(row)}' in instance {idx} is not numeric."
+                )
+
+    bad = _first_non_finite(X)
+    if bad is not None:
+        raise ValueError(
+            f"Value of '{bad[1]}' in instance {bad[0]} is not a finite number "
+            "(NaN, infinity or too large for float32)."
+        )
+
+    X.flags.writeable = False
+    return X
 
-    return np.array(X_rows, dtype=float)
+
+def _build_matrix_columnar(columns, data):
+    """
+    Validate a columnar payload and build the feature matrix X in FEATURE order.
+
+    Args:
+        columns (List[str]): Feature names, in the order used by the rows of `data`.
+        data (List[List[float]]): One row of numeric values per instance.
+
+    Returns:
+        X (np.ndarray): float32 feature matrix with shape (n_instances, n_features).
+
+    Side effects:
+        Raises ValueError with a clear message if columns are missing or values are invalid.
+    """
+    if not isinstance(columns, list):
+        raise ValueError("The 'columns' field must be a list of feature names.")
+    missing = [f for f in FEATURE_ORDER_T if f not in columns]
+    if missing:
+        raise ValueError(f"Missing features in 'columns': {missing}")
+    if not isinstance(data, list) or len(data) == 0:
+        raise ValueError("The 'data' field must be a non-empty list.")
+
+    try:
+        # Overflow to inf in the float32 cast is reported below, not as a numpy warning
+        with np.errstate(over="ignore"):
+            X = np.asarray(data, dtype=np.float32)
+    except (TypeError, ValueError):
+        X = None
+    if X is None or X.ndim != 2 or X.shape[1] != len(columns):
+        raise ValueError(
+            f"The 'data' field must be a list of rows with {len(columns)} numeric values "
+            "(one per column)."
+        )
+
+    # Reorder (and drop extra) columns with one gather
+    col_idx = [columns.index(f) for f in FEATURE_ORDER_T]
+    if col_idx != list(range(len(columns))):
+        X = X[:, col_idx]
+
+    # Same rule as the dict format: null, "nan", "inf" and float32 overflow all end up
+    # as NaN / infinity here
+    bad = _first_non_finite(X)
+    if bad is not None:
+        raise ValueError(
+            f"Value of '{bad[1]}' in row {bad[0]} of 'data' is not a finite number "
+            "(NaN, infinity or too large for float32)."
+        )
+    return X
+
+
+def _predict_proba(X):
+    """
+    Run the model on X (no caching).
+
+    Args:
+        X (np.ndarray): float32 feature matrix with shape (n_instances, n_features).
+
+    Returns:
+        probas (np.ndarray): Class probabilities with shape (n_instances, n_classes).
+    """
+    if PREDICTOR is not None:
+        # Output shape is (n_instances, n_targets=1, n_classes)
+        return PREDICTOR.predict(tl2cgen.DMatrix(X)).reshape(X.shape[0], -1)
+    if SESSION is not None:
+        return SESSION.run(["probabilities"], {"X": X})[0]
+    return MODEL.predict_proba(X)
+
+
+def _batch_loop():
+    """
+    Batching thread: collect queued requests until MAX_BATCH rows or MAX_WAIT_MS,
+    run the model once on the stacked rows and hand each request its slice.
+    """
+    while True:
+        batch = [_BATCH_QUEUE.get()]
+        size = batch[0].size
+        deadline = time.monotonic() + MAX_WAIT_MS / 1000.0
+        while size < MAX_BATCH:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = _BATCH_QUEUE.get(timeout=timeout)
+            except queue.Empty:
+                break
+            batch.append(item)
+            size += item.size
+
+        try:
+            probas = _predict_proba(np.concatenate([r.data for r in batch]))
+        except Exception as e:
+            for r in batch:
+                r.future.set_exception(e)
+            continue
+
+        offset = 0
+        for r in batch:
+            r.future.set_result(probas[offset:offset + r.size])
+            offset += r.size
+
+
+def _batched_predict_proba(X):
+    """
+    Same as _predict_proba, but goes through the batching thread so that rows from
+    concurrent requests share one model call. Blocks until the result is ready.
+    """
+    global _BATCHER_PID
+    # Start the thread lazily in the serving process: threads do not survive a fork
+    # (e.g. a preloaded app forked into server workers).
+    if _BATCHER_PID != os.getpid():
+        with _BATCHER_LOCK:
+            if _BATCHER_PID != os.getpid():
+                threading.Thread(target=_batch_loop, name="predict-batcher", daemon=True).start()
+                _BATCHER_PID = os.getpid()
+
+    req = _InferenceRequest(data=X)
+    _BATCH_QUEUE.put(req)
+    return req.future.result()
+
+
+def _cached_predict_proba(X):
+    """
+    Same as _predict_proba, but rows already seen are served from the prediction cache
+    and only the remaining rows go through the model (in a single call).
+
+    Args:
+        X (np.ndarray): float32 feature matrix with shape (n_instances, n_features).
+
+    Returns:
+        probas (np.ndarray): Class probabilities with shape (n_instances, n_classes).
+
+    Side effects:
+        Inserts the newly computed rows into the cache, evicting the least recently used ones.
+    """
+    keys = [row.tobytes() for row in X]
+    probas = [None] * len(keys)
+    missing = []
+    with _PROBA_CACHE_LOCK:
+        for i, key in enumerate(keys):
+            hit = _PROBA_CACHE.get(key)
+            if hit is None:
+                missing.append(i)
+            else:
+                _PROBA_CACHE.move_to_end(key)
+                probas[i] = hit
+
+    if missing:
+        run = _batched_predict_proba if ENABLE_BATCHING else _predict_proba
+        fresh = run(X[missing])
+        with _PROBA_CACHE_LOCK:
+            for i, p in zip(missing, fresh):
+                # Copy so a cached row does not keep the whole batch result alive
+                p = p.copy()
+                probas[i] = p
+                _PROBA_CACHE[keys[i]] = p
+            while len(_PROBA_CACHE) > PROBA_CACHE_SIZE:
+                _PROBA_CACHE.popitem(last=False)
+
+    return np.stack(probas)
+
+
+def _cached_predict_proba_one(X):
+    """
+    Single-row specialization of _cached_predict_proba (the common online case): one cache
+    lookup, and on a miss the row goes to the model as-is, without the per-row key list,
+    gather and stacking of the batch path.
+
+    Args:
+        X (np.ndarray): float32 feature matrix with shape (1, n_features).
+
+    Returns:
+        probas (np.ndarray): Class probabilities with shape (1, n_classes).
+    """
+    key = X.tobytes()
+    with _PROBA_CACHE_LOCK:
+        proba = _PROBA_CACHE.get(key)
+        if proba is not None:
+            _PROBA_CACHE.move_to_end(key)
+
+    if proba is None:
+        run = _batched_predict_proba if ENABLE_BATCHING else _predict_proba
+        proba = run(X)[0].copy()
+        with _PROBA_CACHE_LOCK:
+            _PROBA_CACHE[key] = proba
+            while len(_PROBA_CACHE) > PROBA_CACHE_SIZE:
+                _PROBA_CACHE.popitem(last=False)
+
+    return proba[np.newaxis]
+
+
+def _predict(X):
+    """
+    Run the model on X.
+
+    Args:
+        X (np.ndarray): float32 feature matrix with shape (n_instances, n_features).
+
+    Returns:
+        preds (np.ndarray): Predicted class ids with shape (n_instances,).
+        probas (np.ndarray | None): Class probabilities with shape (n_instances, n_classes),
+            or None if the model has no predict_proba.
+
+    Notes:
+        Arrays are returned as-is: _json_response serializes numpy directly, so there is
+        no need to build nested Python lists.
+    """
+    if PREDICTOR is not None or SESSION is not None or hasattr(MODEL, "predict_proba"):
+        if X.shape[0] == 1:
+            probas = _cached_predict_proba_one(X)
+        else:
+            probas = _cached_predict_proba(X)
+        # Labels come from the same probabilities: no second pass over the forest.
+        # Probability columns follow MODEL.classes_ (also in the ONNX export).
+        preds = MODEL.classes_[probas.argmax(axis=1)]
+        return preds, probas
+
+    # Classifier without probabilities: plain predict
+    return MODEL.predict(X), None
 
 
 @app.get("/")
@@ -108,7 +503,7 @@ def index():
     Returns:
         JSON response with API status and expected features.
     """
-    return jsonify(
+    return _json_response(
         {
             "message": "Classification API (wine) is up",
             "expected_features": FEATURE_ORDER,
@@ -132,6 +527,12 @@ def predict():
             ...
           ]
         }
+
+        or, columnar:
+        {
+          "columns": ["alcohol", "malic_acid", ...],
+          "data": [[13.2, 1.78, ...], ...]
+        }
         
         Example output:
         {
@@ -140,41 +541,52 @@ def predict():
           "probas": [[p0,p1,p2], ...],
           "class_names": ["class_0","class_1","class_2"]
         }
-    """
-    try:
-        payload = request.get_json(force=True, silent=False)
-        if "instances" not in payload:
-            return jsonify({"error": "JSON body must include the 'instances' key."}), 400
 
-        X = _validate_and_build_matrix(payload["instances"])
-        preds = MODEL.predict(X).tolist()
+        With ?precision=q8, "probas" is replaced by "probas_q8", "shape" and "scale"
+        (see _quantize_probas).
+    """
+    precision = request.args.get("precision", "float")
+    if precision not in ("float", "q8"):
+        return _json_response({"error": "The 'precision' parameter must be 'float' or 'q8'."}), 400
 
-        # Probabilities (if the classifier supports it)
-        if hasattr(MODEL, "predict_proba"):
-            probas = MODEL.predict_proba(X).tolist()
+    try:
+        # orjson.JSONDecodeError is a ValueError: malformed bodies are reported as 400
+        payload = orjson.loads(request.get_data())
+        if isinstance(payload, dict) and "columns" in payload and "data" in payload:
+            X = _build_matrix_columnar(payload["columns"], payload["data"])
+        elif isinstance(payload, dict) and "instances" in payload:
+            X = _validate_and_build_matrix(payload["instances"])
         else:
-            probas = None
+            return _json_response(
+                {"error": "JSON body must include the 'instances' key (or 'columns' and 'data')."}
+            ), 400
+
+        preds, probas = _predict(X)
 
-        # Map class ids to readable class names
-        classes_str = [CLASS_NAMES[i] for i in preds]
+        # Map class ids to readable class names with one numpy gather
+        # (tolist: orjson does not serialize numpy string arrays)
+        classes_str = CLASS_NAMES_ARR[np.asarray(preds, dtype=np.intp)].tolist()
 
         resp = {
             "predictions": preds,
             "classes": classes_str,
-            "probas": probas,
-            "class_names": CLASS_NAMES,
         }
-        return jsonify(resp), 200
+        if precision == "q8" and probas is not None:
+            resp.update(_quantize_probas(probas))
+        else:
+            resp["probas"] = probas
+        resp["class_names"] = CLASS_NAMES
+        return _json_response(resp), 200
 
     except ValueError as e:
         # Controlled validation errors
-        return jsonify({"error": str(e)}), 400
+        return _json_response({"error": str(e)}), 400
     except Exception as e:
         # Unexpected errors (simple log)
-        return jsonify({"error": f"Internal error: {str(e)}"}), 500
+        return _json_response({"error": f"Internal error: {str(e)}"}), 500
 
 
 if __name__ == "__main__":
-    # Run only if executing python app.py directly (not in gunicorn, etc.)
+    # Local debug only: the container serves the app through gunicorn (gunicorn.conf.py)
     # host='0.0.0.0' is key inside Docker to expose to the outside
     app.run(host="0.0.0.0", port=5000, debug=False)
\ No newline at end of file
@@ -0,0 +1,19 @@
+"""
+Gunicorn configuration for serving the API.
+
+- Sync workers, one thread each: inference is CPU-bound, so parallelism comes from processes.
+- preload_app loads the model once in the master before forking, so workers share its
+  memory pages (copy-on-write) instead of each loading their own copy.
+
+Execution:
+    gunicorn -c gunicorn.conf.py app:app
+"""
+
+import multiprocessing
+import os
+
+bind = "0.0.0.0:5000"
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+worker_class = "sync"
+threads = 1
+preload_app = True
@@ -1,8 +1,12 @@
 """
 Train a classification model on sklearn's 'wine' dataset and save artifacts.
 
-- Model: RandomForestClassifier (robust with strong baseline performance).
-- Saved artifacts: model.joblib and features.json (feature column order used to train).
+- Model: RandomForestClassifier (robust with strong baseline performance), sized by a small
+  grid search: the smallest forest whose CV accuracy is within 1 std of the best.
+- Saved artifacts: model.joblib, model_meta.json (chosen hyperparameters), model_tl.so
+  (same model compiled to native code with Treelite, used for serving), model.onnx
+  (ONNX export, serving fallback) and features.json (feature column order used to train
+  and class names).
 
 Execution:
     python train_model.py
@@ -19,9 +23,11 @@ import numpy as np
 from sklearn.datasets import load_wine
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import classification_report, accuracy_score
-from sklearn.model_selection import train_test_split
-from sklearn.pipeline import Pipeline
-from sklearn.preprocessing import StandardScaler
+from sklearn.model_selection import GridSearchCV, train_test_split
+from skl2onnx import convert_sklearn
+from skl2onnx.common.data_types import FloatTensorType
+import tl2cgen
+import treelite
 
 
 def load_data():
@@ -29,30 +35,64 @@ def load_data():
     Load the 'wine' dataset from sklearn.
 
     Returns:
-        X (np.ndarray): Feature matrix with shape (n_samples, n_features).
+        X (np.ndarray): float32 feature matrix with shape (n_samples, n_features).
         y (np.ndarray): Target vector with shape (n_samples,).
         feature_names (list[str]): List of feature names.
+        class_names (list[str]): Readable class names, indexed by class id.
     
     Side effects:
         None.
     """
     data = load_wine()
-    X = data.data
+    # float32 end-to-end, like the API: sklearn trees cast X to float32 anyway, so this
+    # avoids a float64 -> float32 copy in every grid-search fit
+    X = data.data.astype(np.float32)
     y = data.target
     feature_names = list(data.feature_names)
-    return X, y, feature_names
+    class_names = list(data.target_names)
+    return X, y, feature_names, class_names
+
+
+# Hyperparameter grid. Prediction cost grows linearly with the number of trees,
+# so the search favours small forests (see _smallest_forest_within_1std).
+PARAM_GRID = {
+    "n_estimators": [20, 50, 100],
+    "max_depth": [None, 4, 6],
+    "min_samples_leaf": [1, 3],
+}
+
+
+def _smallest_forest_within_1std(cv_results):
+    """
+    GridSearchCV `refit` callable: among candidates whose mean CV accuracy is within one
+    standard deviation of the best, pick the one with the fewest trees (best mean accuracy
+    breaks ties).
+
+    Args:
+        cv_results (dict): GridSearchCV.cv_results_.
+
+    Returns:
+        index (int): Index of the chosen candidate in cv_results.
+    """
+    means = cv_results["mean_test_score"]
+    stds = cv_results["std_test_score"]
+    n_trees = np.asarray(cv_results["param_n_estimators"], dtype=int)
+    best = np.argmax(means)
+    candidates = np.flatnonzero(means >= means[best] - stds[best])
+    return int(min(candidates, key=lambda i: (n_trees[i], -means[i])))
 
 
 def train_model(X, y):
     """
-    Train a simple pipeline: StandardScaler + RandomForestClassifier.
+    Train a RandomForestClassifier on the raw features, sized by a grid search over PARAM_GRID.
 
     Args:
         X (np.ndarray): Feature matrix.
         y (np.ndarray): Target vector.
 
     Returns:
-        pipe (Pipeline): Trained pipeline ready to predict.
+        clf (RandomForestClassifier): Trained classifier ready to predict.
+        meta (dict): Chosen hyperparameters and their CV accuracy.
     
     Side effects:
         Does not persist to disk; trains in-memory only.
@@ -62,53 +102,122 @@ def train_model(X, y):
         X, y, test_size=0.2, random_state=42, stratify=y
     )
 
-    # Pipeline with scaling (harmless for RF; useful if switching to LR later)
-    pipe = Pipeline(
-        steps=[
-            ("scaler", StandardScaler()),
-            ("clf", RandomForestClassifier(n_estimators=200, random_state=42)),
-        ]
+    # No StandardScaler: tree splits are per-feature thresholds, so scaling does not change
+    # the model, but it would cost an extra pass over X on every prediction
+    search = GridSearchCV(
+        RandomForestClassifier(random_state=42),
+        PARAM_GRID,
+        scoring="accuracy",
+        cv=5,
+        refit=_smallest_forest_within_1std,
+        n_jobs=-1,
     )
-    pipe.fit(X_train, y_train)
+    search.fit(X_train, y_train)
+    clf = search.best_estimator_
+    to_float32(clf)
+
+    meta = dict(search.best_params_)
+    meta["cv_accuracy"] = float(search.cv_results_["mean_test_score"][search.best_index_])
+    print(f"Chosen hyperparameters: {meta}")
 
     # Basic evaluation
-    y_pred = pipe.predict(X_test)
+    y_pred = clf.predict(X_test)
     acc = accuracy_score(y_test, y_pred)
     print(f"Accuracy (test): {acc:.4f}")
     print("Classification report:\n", classification_report(y_test, y_pred))
 
-    return pipe
+    return clf, meta
 
 
-def save_artifacts(model, feature_names, out_dir="."):
+def to_float32(clf):
     """
-    Persist the model and the feature order to disk.
+    Make the trained forest float32-native, matching the float32 matrix built by the API
+    and the float32 ONNX export.
+
+    sklearn trees always store thresholds as float64, so each split threshold is rounded
+    down to the nearest float32 value instead. For float32 inputs `x <= t32` then takes
+    exactly the same branch as `x <= t`, so the ONNX graph (float32 thresholds) and the
+    sklearn model agree on every split.
 
     Args:
-        model (Pipeline): Trained model/pipeline.
+        clf (RandomForestClassifier): Trained forest.
+
+    Side effects:
+        Modifies the tree thresholds in place.
+    """
+    for est in clf.estimators_:
+        tree = est.tree_
+        split = tree.feature >= 0  # leaves have feature == -2
+        thresholds = tree.threshold  # writable view on the tree nodes
+        t32 = thresholds.astype(np.float32)
+        rounded_up = t32 > thresholds
+        t32[rounded_up] = np.nextafter(t32[rounded_up], np.float32(-np.inf))
+        thresholds[split] = t32[split]
+
+
+def save_artifacts(model, feature_names, class_names, meta, out_dir="."):
+    """
+    Persist the model, its metadata, the feature order and the class names to disk.
+
+    Args:
+        model (RandomForestClassifier): Trained model.
         feature_names (list[str]): Column order used during training.
+        class_names (list[str]): Readable class names, indexed by class id.
+        meta (dict): Chosen hyperparameters (from train_model).
         out_dir (str): Output directory for artifacts.
 
     Side effects:
         Creates/overwrites files:
             - model.joblib
+            - model_meta.json
+            - model.onnx
+            - model_tl.so
             - features.json
     """
     out = Path(out_dir)
     out.mkdir(parents=True, exist_ok=True)
 
-    joblib.dump(model, out / "model.joblib")
+    # Uncompressed so the API can memory-map the arrays on load
+    joblib.dump(model, out / "model.joblib", compress=0)
+    with open(out / "model_meta.json", "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+    # ONNX export: the forest becomes a single fused TreeEnsembleClassifier op.
+    # zipmap=False keeps probabilities as a plain float tensor instead of a list of dicts.
+    onx = convert_sklearn(
+        model,
+        initial_types=[("X", FloatTensorType([None, len(feature_names)]))],
+        target_opset=17,
+        options={id(model): {"zipmap": False}},
+    )
+    with open(out / "model.onnx", "wb") as f:
+        f.write(onx.SerializeToString())
+
+    # Treelite: compile the forest into a shared library of plain C if/else chains,
+    # one function per tree, specialized to each tree's shape (requires gcc)
+    tl2cgen.export_lib(
+        treelite.sklearn.import_model(model),
+        toolchain="gcc",
+        libpath=str(out / "model_tl.so"),
+        params={"parallel_comp": 4},
+    )
+
     with open(out / "features.json", "w", encoding="utf-8") as f:
-        json.dump({"feature_order": feature_names}, f, ensure_ascii=False, indent=2)
+        json.dump(
+            {"feature_order": feature_names, "class_names": class_names},
+            f,
+            ensure_ascii=False,
+            indent=2,
+        )
 
     print(f"Model saved to: {out.resolve()}")
 
 
 def main():
     """Entry point when executing the script directly."""
-    X, y, feature_names = load_data()
-    model = train_model(X, y)
-    save_artifacts(model, feature_names)
+    X, y, feature_names, class_names = load_data()
+    model, meta = train_model(X, y)
+    save_artifacts(model, feature_names, class_names, meta)
 
 
 if __name__ == "__main__":